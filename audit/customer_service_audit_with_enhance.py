@@ -1,14 +1,22 @@
 import json
+import os
+
+# 线程数需在导入 torch/ctranslate2 之前设置；超订超线程会拖慢 CTranslate2 的 GEMM
+os.environ.setdefault("OMP_NUM_THREADS", str(os.cpu_count() or 4))
+
+import sys
+import tempfile
 import torch
 import torchaudio
-import os
 import subprocess
-from faster_whisper import WhisperModel
 from resemble_enhance.enhancer.inference import denoise, enhance
 import ollama
 
-# 设置设备（建议 GPU 环境使用 "cuda" 或 "mps"）
-device = "cpu"
+# 共用 audit_processing 中已配置好的设备与 Whisper 模型实例
+# （CUDA 可用时自动切换 float16/int8_float16，整个代码库只加载一份模型，
+# 且模型在首次转录时才真正加载）
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from audit_processing import DEVICE as device, get_whisper
 
 # 音频预处理（去噪 + 增强）
 def preprocess_audio(audio_file, output_file="enhanced_audio.wav"):
@@ -28,28 +36,38 @@ def preprocess_audio(audio_file, output_file="enhanced_audio.wav"):
     dwav, sr = torchaudio.load(wav_file)
     dwav = dwav.mean(dim=0)  # 转为单声道
 
-    wav_denoised, new_sr = denoise(dwav, sr, device)
-    torchaudio.save("denoised.wav", wav_denoised.unsqueeze(0).to(torch.float32), new_sr)
-
-    wav_enhanced, new_sr = enhance(
-        wav_denoised, new_sr, device, nfe=64, solver="midpoint", lambd=0.1, tau=0.5
-    )
-
-    # 检查是否为静音（增强失败）
-    if torch.max(torch.abs(wav_enhanced)) < 1e-5:
+    # inference_mode 关闭自动求导跟踪，省去增强网络的梯度缓冲
+    with torch.inference_mode():
+        wav_denoised, new_sr = denoise(dwav, sr, device)
+        # 中间结果默认不落盘（每次审核省一次磁盘写且避免固定文件名并发冲突）；
+        # 需要调试时设置 DEBUG_AUDIO 环境变量
+        if os.environ.get("DEBUG_AUDIO"):
+            import uuid
+            torchaudio.save(f"/tmp/denoised_{uuid.uuid4().hex}.wav",
+                            wav_denoised.unsqueeze(0).to(torch.float32), new_sr)
+
+        wav_enhanced, new_sr = enhance(
+            wav_denoised, new_sr, device, nfe=64, solver="midpoint", lambd=0.1, tau=0.5
+        )
+
+    # 检查是否为静音（增强失败）——单次归约并只同步一次标量
+    peak = wav_enhanced.detach().abs().amax().item()
+    if peak < 1e-5:
         raise ValueError("增强后的音频几乎为静音，可能处理失败。")
 
-    # 保存增强后音频，确保 float32 格式
-    torchaudio.save(output_file, wav_enhanced.unsqueeze(0).to(torch.float32), new_sr)
+    # 保存增强后音频，确保 float32 格式（已是 float32 时不做多余拷贝）。
+    # 先写临时文件再原子重命名，进程中途被杀也不会留下半截文件
+    out = wav_enhanced if wav_enhanced.dtype == torch.float32 else wav_enhanced.to(torch.float32)
+    with tempfile.NamedTemporaryFile(suffix=".wav", dir=os.path.dirname(output_file) or ".", delete=False) as tmp:
+        tmp_path = tmp.name
+    torchaudio.save(tmp_path, out.unsqueeze(0), new_sr)
+    os.replace(tmp_path, output_file)
     return output_file
 
-# Whisper 模型初始化
-whisper_model = WhisperModel("medium", device=device, compute_type="int8")
-
 # 音频转文字
 def transcribe_audio(audio_file):
     enhanced_file = preprocess_audio(audio_file)
-    segments, info = whisper_model.transcribe(
+    segments, info = get_whisper().transcribe(
         enhanced_file, language="zh", vad_filter=True
     )
     print(f"Detected language: {info.language}, probability: {info.language_probability:.2f}")
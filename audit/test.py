@@ -23,18 +23,29 @@ model = WhisperModel("medium", device="cpu", compute_type="int8")
 
 # 执行转录
 print("开始语音转文字...")
-segments_generator, info = model.transcribe(audio_path)
-
-# ✅ 转换为 list，防止生成器被多次消费后为空
-segments = list(segments_generator)
+try:
+    # 批量推理：将 VAD 切出的语音段合并成一次前向计算，长音频可提速数倍
+    from faster_whisper import BatchedInferencePipeline
+    batched_model = BatchedInferencePipeline(model=model)
+    segments_generator, info = batched_model.transcribe(
+        audio_path, vad_filter=True,
+        batch_size=int(os.environ.get("WHISPER_BATCH_SIZE", "16"))
+    )
+except ImportError:
+    # 旧版 faster_whisper 没有 BatchedInferencePipeline，退回逐段转录
+    segments_generator, info = model.transcribe(audio_path)
 
 print(f"\n识别语言：{info.language}（置信度：{info.language_probability:.2f}）")
 print("\n转录文本内容：")
-for segment in segments:
+
+# ✅ 流式消费生成器：边解码边打印进度，同时收集文本，只遍历一次
+parts = []
+for segment in segments_generator:
     print(f"[{segment.start:.2f}s - {segment.end:.2f}s] {segment.text}")
+    parts.append(segment.text)
 
 # 合并转录文本
-full_transcription = " ".join([segment.text for segment in segments]).strip()
+full_transcription = " ".join(parts).strip()
 
 if not full_transcription:
     print("⚠️ 语音内容识别为空，请检查音频质量或格式是否正确。")
@@ -93,18 +104,20 @@ prompt = f"""
 """
 
 
-# 配置 Ollama 请求
+# 配置 Ollama 请求（复用连接池，并用 keep_alive 将模型常驻内存）
+SESSION = requests.Session()
 ollama_url = "http://localhost:11434/api/generate"
 payload = {
     "model": "gemma3:4b",  # 替换成你正在运行的本地模型名
     "prompt": prompt.strip(),
-    "stream": False
+    "stream": False,
+    "keep_alive": "24h"
 }
 
 print("\n正在调用 Ollama 分析...")
 
 try:
-    response = requests.post(ollama_url, json=payload)
+    response = SESSION.post(ollama_url, json=payload)
     response.raise_for_status()
     result = response.json()
     print("\n🧠 Ollama 分析结果：")
@@ -1,18 +1,51 @@
-from fastapi import FastAPI, File, UploadFile, Path, HTTPException
+from fastapi import BackgroundTasks, FastAPI, File, UploadFile, Path, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
+import aiofiles
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+import mmap
+import secrets
 import shutil
 import os
-import uuid
+import sys
 import zipfile
 
+# Swap in a faster event loop before any loop is created. uvloop (libuv-based,
+# already shipped via uvicorn[standard]) sheds per-request syscall overhead on
+# every endpoint; the stock asyncio loop remains the fallback.
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
 # Assuming audit_processing.py is in the same directory or accessible in PYTHONPATH
-from audit_processing import perform_full_audio_audit
+from audit_processing import (
+    perform_full_audio_audit,
+    perform_full_audio_audit_bytes,
+    perform_full_audio_audit_stream,
+    warm_up_ollama,
+)
+# Optional Celery offload; audit_task/celery_app are None when not configured.
+from tasks import audit_task, celery_app
+
+# Per-file progress messages log at DEBUG so they no-op (no formatting, no
+# stdout lock, no write syscall) at the INFO/WARNING levels used in production.
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Customer Service Audio Audit API")
 
+
+@app.on_event("startup")
+async def warm_up_llm():
+    """Pins the Ollama model in server memory so the first audit hits a hot model."""
+    warm_up_ollama()
+
 # Mount static files directory (before any conflicting routes)
 # Ensure 'static' directory exists at the same level as main.py
 STATIC_DIR = "static"
@@ -25,6 +58,42 @@ app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 TEMP_UPLOADS_DIR = "temp_uploads"
 os.makedirs(TEMP_UPLOADS_DIR, exist_ok=True) # Ensure temp directory exists
 
+# Resolved once so per-request containment checks don't re-walk the path.
+_TEMP_UPLOADS_REAL = os.path.realpath(TEMP_UPLOADS_DIR)
+
+# Chunk size for streaming uploads to disk. Reading in bounded chunks keeps
+# per-request memory flat regardless of payload size, instead of draining the
+# whole spooled body at once.
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Chunk size for copying entries out of uploaded ZIPs. 4 MiB is the sweet spot
+# for DEFLATE pipelines — small chunks pay per-chunk Python overhead, huge ones
+# hurt load balance — but file-size distributions vary, so operators can
+# re-tune without a deploy.
+ZIP_CHUNK_SIZE = int(os.environ.get("ZIP_CHUNK_SIZE", str(4 * 1024 * 1024)))
+
+# ZIP entries smaller than this are read into memory and audited without a
+# disk round-trip; larger ones are extracted to disk as before.
+IN_MEMORY_ZIP_ENTRY_LIMIT = int(os.environ.get("IN_MEMORY_ZIP_ENTRY_LIMIT", str(8 * 1024 * 1024)))
+
+# Single-file uploads below this size are fed to the auditor straight from
+# the spooled upload buffer instead of being written to a temp file first.
+IN_MEMORY_UPLOAD_LIMIT = int(os.environ.get("IN_MEMORY_UPLOAD_LIMIT", str(8 * 1024 * 1024)))
+
+# Zip-bomb guards: cap the total bytes an archive may decompress to, and the
+# per-entry compression ratio. Legitimate DEFLATE rarely exceeds ~10:1 even on
+# silence-heavy WAVs; a 200:1 entry is an attack, not a recording.
+MAX_EXTRACTED_BYTES = int(os.environ.get("MAX_EXTRACTED_BYTES", str(2 * 1024 * 1024 * 1024)))
+MAX_COMPRESSION_RATIO = int(os.environ.get("MAX_COMPRESSION_RATIO", "200"))
+
+# Local-file-header, empty-archive, and spanned-archive ZIP signatures. Any
+# real ZIP starts with one of these four bytes sequences.
+ZIP_MAGIC_PREFIXES = (b"PK\x03\x04", b"PK\x05\x06", b"PK\x07\x08")
+
+# Extensions (without the dot) accepted from uploaded ZIP archives. A
+# frozenset gives O(1) membership checks inside the per-entry loop.
+SUPPORTED_AUDIO_EXTENSIONS = frozenset({"wav", "mp3", "m4a", "flac", "ogg", "aac"})  # Add more as needed
+
 # --- Pydantic Models ---
 
 class AudioAuditResponse(BaseModel):
@@ -55,10 +124,66 @@ class ZipUploadResponse(BaseModel):
     processed_files: List[AudioAuditResponse] = []
     errors: List[str] = [] # For general errors like "not a zip file"
 
+# --- Helpers ---
+
+class _SeekableMmap(mmap.mmap):
+    """mmap grows a seekable() method only in Python 3.13; zipfile needs it."""
+    def seekable(self):
+        return True
+
+    def seek(self, pos, whence=0):
+        # Regular files raise OSError on out-of-range seeks; mmap raises
+        # ValueError, which zipfile's ZIP64 end-of-archive probe (it seeks
+        # before offset 0 on tiny archives) doesn't expect.
+        try:
+            return super().seek(pos, whence)
+        except ValueError as e:
+            raise OSError(str(e)) from None
+
+
+def _remove_temp_file(path: str) -> None:
+    """Removes a temp file, logging (but swallowing) cleanup failures."""
+    try:
+        os.remove(path)
+        logger.debug("Removed temporary file: %s", path)
+    except FileNotFoundError:
+        pass  # Never written (in-memory path) or already gone; nothing to do.
+    except OSError as e:
+        # Log this error, but don't let cleanup failure break anything.
+        logger.warning("Error removing temporary file %s: %s", path, e)
+
+
+def _remove_extraction_dir(extraction_path: str) -> None:
+    """
+    Removes a flat extraction directory using dir_fd-relative unlinks.
+
+    shutil.rmtree re-resolves the full path for every entry (lstat + unlink
+    per file); holding the directory fd and unlinking by name skips that path
+    walk, which adds up for archives with many extracted files. Falls back to
+    rmtree if anything unexpected (e.g. a subdirectory) shows up.
+    """
+    try:
+        fd = os.open(extraction_path, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return  # Never created (all-in-memory archive) or already gone.
+    try:
+        for name in os.listdir(fd):
+            os.unlink(name, dir_fd=fd)
+    except OSError:
+        shutil.rmtree(extraction_path, ignore_errors=True)
+        return
+    finally:
+        os.close(fd)
+    try:
+        os.rmdir(extraction_path)
+    except OSError as e:
+        logger.warning("Error removing extraction directory %s: %s", extraction_path, e)
+
+
 # --- API Endpoints ---
 
-@app.post("/upload/audio/", response_model=AudioAuditResponse)
-async def upload_audio(file: UploadFile = File(...)):
+@app.post("/upload/audio/", response_model=AudioAuditResponse, response_class=ORJSONResponse)
+async def upload_audio(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """
     Accepts a single audio file (e.g., .wav, .mp3) for transcription and analysis.
     The processing is synchronous in this version.
@@ -71,22 +196,56 @@ async def upload_audio(file: UploadFile = File(...)):
     if not filename: # Should not happen with UploadFile but good check
         raise HTTPException(status_code=400, detail="No filename provided.")
     
-    # Basic sanitization to prevent path traversal, though FastAPI/Starlette might handle some of this.
-    # This is a naive sanitization. Production systems need more robust handling.
-    if ".." in filename or "/" in filename:
-        raise HTTPException(status_code=400, detail="Invalid filename characters.")
-
+    # Strip any client-supplied directory components, then verify the
+    # resolved path is still contained in the uploads dir. Unlike substring
+    # scans for ".." or "/", this also catches backslashes, NULs, and symlink
+    # tricks, and it's one resolution instead of two full string scans.
+    filename = os.path.basename(filename)
     temp_file_path = os.path.join(TEMP_UPLOADS_DIR, filename)
+    try:
+        candidate = os.path.realpath(temp_file_path)
+    except ValueError:
+        # realpath refuses embedded NUL bytes before the containment test runs.
+        raise HTTPException(status_code=400, detail="Invalid filename characters.")
+    if os.path.commonpath([candidate, _TEMP_UPLOADS_REAL]) != _TEMP_UPLOADS_REAL:
+        raise HTTPException(status_code=400, detail="Invalid filename characters.")
+    dispatched = False  # True once a Celery worker owns the temp file
 
     try:
-        print(f"Saving uploaded file to: {temp_file_path}")
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        print(f"File saved. Starting audio audit for: {temp_file_path}")
-        # This is a synchronous call. For long processing, consider background tasks.
-        analysis_result = perform_full_audio_audit(temp_file_path)
-        print(f"Audit complete for {filename}. Result: {analysis_result}")
+        if audit_task is None and file.size is not None and file.size < IN_MEMORY_UPLOAD_LIMIT:
+            # Small synchronous upload: feed the spooled upload buffer straight
+            # to the auditor and skip the temp-file round-trip entirely. Celery
+            # dispatch still needs a path on disk, so it takes the save branch.
+            logger.debug("Starting in-memory audio audit for: %s", filename)
+            # to_thread keeps the event loop serving other requests while
+            # the synchronous audit grinds.
+            analysis_result = await asyncio.to_thread(perform_full_audio_audit_stream, file.file, filename)
+            logger.debug("Audit complete for %s. Result: %s", filename, analysis_result)
+            return AudioAuditResponse(**analysis_result)
+
+        logger.debug("Saving uploaded file to: %s", temp_file_path)
+        # Stream in bounded chunks; aiofiles keeps the blocking write()
+        # syscalls off the event loop so concurrent requests are not starved.
+        async with aiofiles.open(temp_file_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await buffer.write(chunk)
+
+        if audit_task is not None:
+            # Offload the audit to the Celery worker pool; the worker takes
+            # ownership of the temp file and removes it when done.
+            task = audit_task.delay(temp_file_path)
+            dispatched = True
+            logger.info("Dispatched audit of %s as Celery task %s", filename, task.id)
+            return JSONResponse(
+                status_code=202,
+                content={"task_id": task.id, "status": "PENDING",
+                         "message": "Audit queued; poll /results/{task_id}/ for the outcome."},
+            )
+
+        logger.debug("File saved. Starting audio audit for: %s", temp_file_path)
+        # Synchronous fallback when no Celery broker is configured.
+        analysis_result = await asyncio.to_thread(perform_full_audio_audit, temp_file_path)
+        logger.debug("Audit complete for %s. Result: %s", filename, analysis_result)
 
         # Check if the audit itself reported an error
         if analysis_result.get("status") == "FAILED" or "error" in analysis_result:
@@ -98,24 +257,28 @@ async def upload_audio(file: UploadFile = File(...)):
         return AudioAuditResponse(**analysis_result)
 
     except FileNotFoundError as e:
-        print(f"Error: Input file not found during processing for {filename}: {e}")
+        logger.error("Input file not found during processing for %s: %s", filename, e)
         raise HTTPException(status_code=404, detail=f"File not found during processing: {filename}")
     except ValueError as e: # Catching specific errors from audit_processing
-        print(f"Error: Value error during processing for {filename}: {e}")
+        logger.error("Value error during processing for %s: %s", filename, e)
         raise HTTPException(status_code=400, detail=f"Invalid data or processing error: {str(e)}")
     except Exception as e:
-        print(f"Unexpected error during processing for {filename}: {e}")
+        logger.exception("Unexpected error during processing for %s", filename)
         # Log the full exception here in a real app
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
     finally:
-        # Cleanup: Remove the temporary file
-        if os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-                print(f"Successfully removed temporary file: {temp_file_path}")
-            except OSError as e:
-                # Log this error, but don't let cleanup failure break the response
-                print(f"Error removing temporary file {temp_file_path}: {e}")
+        # Cleanup: Remove the temporary file (unless a worker now owns it).
+        # EAFP — _remove_temp_file ignores a missing file, so there's no
+        # stat-then-unlink double syscall or TOCTOU window here.
+        if not dispatched:
+            if sys.exc_info()[0] is None:
+                # Deferred until after the response flushes so the client
+                # doesn't wait on filesystem teardown.
+                background_tasks.add_task(_remove_temp_file, temp_file_path)
+            else:
+                # Background tasks don't run for exception responses; clean
+                # up inline so error paths can't leak temp files.
+                _remove_temp_file(temp_file_path)
         
         # Ensure file object is closed, though `with open` handles the buffer.
         # `file.file` (SpooledTemporaryFile) should be handled by FastAPI/Starlette.
@@ -123,8 +286,10 @@ async def upload_audio(file: UploadFile = File(...)):
              file.close() # Not typically needed for file.file due to context manager
 
 
-@app.post("/upload/zip/", response_model=ZipUploadResponse)
-async def upload_zip(file: UploadFile = File(...)):
+# orjson serializes the potentially huge processed_files payload (hundreds of
+# transcriptions) several times faster than the default json-based response.
+@app.post("/upload/zip/", response_model=ZipUploadResponse, response_class=ORJSONResponse)
+async def upload_zip(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """
     Accepts a ZIP file, extracts audio files, processes each, and returns results.
     Processing is synchronous for each file within the ZIP.
@@ -136,36 +301,134 @@ async def upload_zip(file: UploadFile = File(...)):
         # It's better to raise HTTPException for input validation
         raise HTTPException(status_code=400, detail="Invalid file type. Only .zip files are accepted.")
 
-    # Generate a unique name for the saved ZIP file to avoid conflicts
-    unique_zip_filename = f"{uuid.uuid4().hex}_{file.filename}"
-    temp_zip_path = os.path.join(TEMP_UPLOADS_DIR, unique_zip_filename)
-    
-    # Generate a unique name for the extraction directory
-    extraction_subdir_name = f"zip_extraction_{uuid.uuid4().hex}"
-    extraction_path = os.path.join(TEMP_UPLOADS_DIR, extraction_subdir_name)
+    # One random tag names both the saved ZIP and its extraction directory.
+    # token_hex(8) is plenty for temp-name uniqueness and is cheaper than the
+    # two uuid4().hex calls used previously (one urandom read instead of two).
+    tag = secrets.token_hex(8)
+    temp_zip_path = os.path.join(TEMP_UPLOADS_DIR, f"{tag}.zip")
+    extraction_path = os.path.join(TEMP_UPLOADS_DIR, tag)
 
-    results: List[AudioAuditResponse] = []
+    # Raw result dicts; the response_model validates the whole batch once at
+    # serialization time instead of paying per-entry model construction.
+    results: List[dict] = []
     general_errors: List[str] = []
 
-    SUPPORTED_AUDIO_EXTENSIONS = [".wav", ".mp3", ".m4a", ".flac", ".ogg", ".aac"] # Add more as needed
-
     try:
-        print(f"Saving uploaded ZIP file to: {temp_zip_path}")
-        with open(temp_zip_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        print(f"Successfully saved ZIP file: {temp_zip_path}")
-        
-        # Create the unique extraction directory
-        os.makedirs(extraction_path, exist_ok=True)
-        print(f"Created extraction directory: {extraction_path}")
+        logger.debug("Saving uploaded ZIP file to: %s", temp_zip_path)
+        first_chunk = True
+        async with aiofiles.open(temp_zip_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                if first_chunk:
+                    # Check the magic bytes before writing anything so a
+                    # mistyped or malicious multi-GB non-ZIP upload is
+                    # rejected after one chunk, not after a full disk write.
+                    if not chunk.startswith(ZIP_MAGIC_PREFIXES):
+                        raise HTTPException(status_code=400, detail="Invalid file type. Only .zip files are accepted.")
+                    first_chunk = False
+                await buffer.write(chunk)
+
+        logger.debug("Saved ZIP file: %s", temp_zip_path)
+
+        def _audit_one_bytes(item):
+            item_name, data = item
+            try:
+                analysis_result_dict = perform_full_audio_audit_bytes(data, item_name)
+                logger.debug("Audit complete for %s (in-memory).", item_name)
+                return analysis_result_dict
+            except Exception as e:
+                logger.error("Error processing audio file %s: %s", item_name, e)
+                return {
+                    "audio_file": item_name,
+                    "error": f"Failed to process audio file: {str(e)}",
+                    "status": "FAILED",
+                }
+
+        def _audit_one(item):
+            item_name, item_path = item
+            try:
+                # perform_full_audio_audit expects the file path and already
+                # returns a dict suitable for AudioAuditResponse
+                analysis_result_dict = perform_full_audio_audit(item_path)
+                logger.debug("Audit complete for %s.", item_name)
+                return analysis_result_dict
+            except Exception as e:
+                logger.error("Error processing audio file %s: %s", item_name, e)
+                # Record an error entry for this specific file
+                return {
+                    "audio_file": item_name,
+                    "error": f"Failed to process audio file: {str(e)}",
+                    "status": "FAILED",
+                }
+
+        # Stream-extract: iterate the central directory, copy only supported
+        # audio entries out in bounded chunks, and submit each for audit as
+        # soon as it lands on disk. Extraction of entry N+1 overlaps with the
+        # audit of entry N, and non-audio members are never extracted at all.
+        def _process_archive():
+            with open(temp_zip_path, "rb") as zip_file:
+                # Hint sequential access so the kernel prefetches ahead of the
+                # extraction loop, then hand zipfile a read-only mapping so
+                # central-directory seeks and per-entry reads are served from
+                # the page cache instead of buffered read() calls.
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(zip_file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                if os.fstat(zip_file.fileno()).st_size == 0:
+                    # mmap can't map an empty file; an empty payload is just
+                    # as invalid as a corrupted one.
+                    raise zipfile.BadZipFile("Uploaded file is empty.")
+                mapped = _SeekableMmap(zip_file.fileno(), 0, access=mmap.ACCESS_READ)
+                with mapped, zipfile.ZipFile(mapped, 'r') as zip_ref, \
+                     concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as pool:
+                    futures = []
+                    decompressed_bytes = 0
+                    for info in zip_ref.infolist():
+                        if info.is_dir():
+                            continue
+                        item_name = os.path.basename(info.filename)
+                        # rpartition avoids splitext's tuple allocation; names
+                        # without a dot yield the whole name, which won't match.
+                        item_ext = item_name.rpartition(".")[2].lower()
+                        if item_ext not in SUPPORTED_AUDIO_EXTENSIONS:
+                            logger.debug("Skipping non-audio or unsupported file: %s", info.filename)
+                            continue
+                        # Zip-bomb guards, checked against the central
+                        # directory before a single byte is decompressed. A
+                        # zero compress_size with a nonzero file_size is the
+                        # degenerate (infinite-ratio) bomb case.
+                        if info.file_size > max(info.compress_size, 1) * MAX_COMPRESSION_RATIO:
+                            logger.error("Rejecting %s: entry %s has compression ratio over %d:1.",
+                                         file.filename, info.filename, MAX_COMPRESSION_RATIO)
+                            raise HTTPException(status_code=413, detail="ZIP archive rejected: suspicious compression ratio.")
+                        decompressed_bytes += info.file_size
+                        if decompressed_bytes > MAX_EXTRACTED_BYTES:
+                            logger.error("Rejecting %s: archive decompresses past %d bytes.",
+                                         file.filename, MAX_EXTRACTED_BYTES)
+                            raise HTTPException(status_code=413, detail="ZIP archive rejected: decompressed size exceeds the limit.")
+                        if info.file_size < IN_MEMORY_ZIP_ENTRY_LIMIT:
+                            # Small entry: skip the disk round-trip entirely.
+                            logger.debug("Found supported audio file: %s. Auditing in memory...", info.filename)
+                            futures.append(pool.submit(_audit_one_bytes, (item_name, zip_ref.read(info))))
+                            continue
+                        logger.debug("Found supported audio file: %s. Extracting and starting audit...", info.filename)
+                        # Created lazily: archives whose entries all fit in
+                        # memory never touch the filesystem at all.
+                        os.makedirs(extraction_path, exist_ok=True)
+                        # Index prefix keeps same-named entries from different
+                        # ZIP subdirectories apart on disk.
+                        item_path = os.path.join(extraction_path, f"{len(futures)}_{item_name}")
+                        with zip_ref.open(info) as src, open(item_path, "wb") as dst:
+                            shutil.copyfileobj(src, dst, length=ZIP_CHUNK_SIZE)
+                        futures.append(pool.submit(_audit_one, (item_name, item_path)))
+                    # Collect in submission (= central directory) order.
+                    results.extend(future.result() for future in futures)
 
         try:
-            with zipfile.ZipFile(temp_zip_path, 'r') as zip_ref:
-                zip_ref.extractall(extraction_path)
-            print(f"Successfully extracted ZIP contents to: {extraction_path}")
+            # DEFLATE, disk copies, and the future.result() waits all block;
+            # driving the archive from a worker thread keeps the event loop
+            # serving other requests meanwhile.
+            await asyncio.to_thread(_process_archive)
         except zipfile.BadZipFile:
-            print(f"Error: Uploaded file {file.filename} is not a valid ZIP file or is corrupted.")
+            logger.error("Uploaded file %s is not a valid ZIP file or is corrupted.", file.filename)
             # Return error using the ZipUploadResponse model
             # We don't raise HTTPException here to allow cleanup in `finally`
             general_errors.append(f"Uploaded file '{file.filename}' is not a valid ZIP file or is corrupted.")
@@ -173,33 +436,6 @@ async def upload_zip(file: UploadFile = File(...)):
             return ZipUploadResponse(message="Error processing ZIP file.", errors=general_errors, processed_files=[])
 
 
-        # Walk through the extracted files and process audio files
-        for root, _, files_in_dir in os.walk(extraction_path):
-            for item_name in files_in_dir:
-                item_path = os.path.join(root, item_name)
-                item_ext = os.path.splitext(item_name)[1].lower()
-
-                if item_ext in SUPPORTED_AUDIO_EXTENSIONS:
-                    print(f"Found supported audio file: {item_path}. Starting audit...")
-                    try:
-                        # perform_full_audio_audit expects the file path
-                        analysis_result_dict = perform_full_audio_audit(item_path)
-                        
-                        # Ensure the result is AudioAuditResponse compatible
-                        # perform_full_audio_audit already returns a dict suitable for AudioAuditResponse
-                        results.append(AudioAuditResponse(**analysis_result_dict))
-                        print(f"Audit complete for {item_name}.")
-                    except Exception as e:
-                        print(f"Error processing audio file {item_name}: {e}")
-                        # Add an error entry for this specific file to results
-                        results.append(AudioAuditResponse(
-                            audio_file=item_name,
-                            error=f"Failed to process audio file: {str(e)}",
-                            status="FAILED"
-                        ))
-                else:
-                    print(f"Skipping non-audio or unsupported file: {item_path}")
-        
         if not results and not general_errors: # No audio files found or processed
             general_errors.append("No supported audio files found in the ZIP archive.")
 
@@ -212,7 +448,7 @@ async def upload_zip(file: UploadFile = File(...)):
     except HTTPException: # Re-raise HTTPExceptions if any occurred before main try-catch
         raise
     except Exception as e:
-        print(f"An unexpected error occurred during ZIP processing for {file.filename}: {e}")
+        logger.exception("Unexpected error during ZIP processing for %s", file.filename)
         # Log the full exception here in a real app
         # Return a general error message using the response model
         general_errors.append(f"An unexpected server error occurred: {str(e)}")
@@ -223,21 +459,18 @@ async def upload_zip(file: UploadFile = File(...)):
         )
     finally:
         # --- Cleanup ---
-        # 1. Delete the temporary saved ZIP file
-        if os.path.exists(temp_zip_path):
-            try:
-                os.remove(temp_zip_path)
-                print(f"Successfully removed temporary ZIP file: {temp_zip_path}")
-            except OSError as e:
-                print(f"Error removing temporary ZIP file {temp_zip_path}: {e}") # Log this
-        
-        # 2. Delete the temporary extraction subdirectory and its contents
-        if os.path.exists(extraction_path):
-            try:
-                shutil.rmtree(extraction_path)
-                print(f"Successfully removed extraction directory: {extraction_path}")
-            except OSError as e:
-                print(f"Error removing extraction directory {extraction_path}: {e}") # Log this
+        # Deferred until after the response flushes (seconds of teardown for a
+        # large extracted tree otherwise sit between the audit finishing and
+        # the client seeing results). Background tasks don't run for exception
+        # responses, so error paths clean up inline instead.
+        # Both helpers treat a missing target as a no-op, so no exists()
+        # pre-checks (stat + unlink becomes just unlink).
+        if sys.exc_info()[0] is None:
+            background_tasks.add_task(_remove_temp_file, temp_zip_path)
+            background_tasks.add_task(_remove_extraction_dir, extraction_path)
+        else:
+            _remove_temp_file(temp_zip_path)
+            await asyncio.to_thread(_remove_extraction_dir, extraction_path)
         
         # Ensure the uploaded file object is closed
         if hasattr(file, 'close'):
@@ -248,17 +481,24 @@ async def upload_zip(file: UploadFile = File(...)):
 async def get_task_results(task_id: str = Path(..., title="Task ID", description="The ID of the processing task.")):
     """
     Retrieves the status of a processing task.
-    Currently, as processing is synchronous, this endpoint serves as a placeholder.
+    Queries the Celery results backend when one is configured; otherwise
+    processing is synchronous and this endpoint serves as a placeholder.
     """
-    # In a future asynchronous system, this endpoint would query a task manager
-    # (e.g., Celery results backend, database) for the status of task_id.
-    # For now, it returns a message reflecting synchronous processing.
-    
-    # Basic check for a "valid" looking task_id, though we don't store them.
-    # This is just to make the placeholder slightly more interactive.
+    # Basic check for a "valid" looking task_id.
     if not task_id or len(task_id) < 3: # Arbitrary minimum length
         raise HTTPException(status_code=400, detail="Invalid Task ID format.")
 
+    if celery_app is not None:
+        from celery.result import AsyncResult
+        task = AsyncResult(task_id, app=celery_app)
+        result = AudioAuditResponse(**task.result) if task.successful() else None
+        return TaskStatusResponse(
+            task_id=task_id,
+            status=task.state,
+            message="Task state retrieved from the Celery results backend.",
+            result=result
+        )
+
     return TaskStatusResponse(
         task_id=task_id,
         status="NOT_APPLICABLE_FOR_SYNC_PROCESSING",
@@ -267,13 +507,31 @@ async def get_task_results(task_id: str = Path(..., title="Task ID", description
     )
 
 # --- Root Endpoint to Serve Frontend ---
-@app.get("/", response_class=FileResponse)
+
+# (mtime_ns, body bytes, ETag) for static/index.html. FileResponse re-opens
+# and re-reads the file per request; caching makes "/" a memcpy-only path.
+_index_cache = None
+
+@app.get("/")
 async def read_root():
     """Serves the main HTML page for the frontend."""
+    global _index_cache
     html_file_path = os.path.join(STATIC_DIR, "index.html")
-    if not os.path.exists(html_file_path):
+    try:
+        mtime_ns = os.stat(html_file_path).st_mtime_ns
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="index.html not found")
-    return FileResponse(html_file_path)
+    # The mtime gate keeps dev edits visible without restarting the server.
+    if _index_cache is None or _index_cache[0] != mtime_ns:
+        with open(html_file_path, "rb") as f:
+            body = f.read()
+        _index_cache = (mtime_ns, body, hashlib.md5(body).hexdigest())
+    _, body, etag = _index_cache
+    return Response(
+        content=body,
+        media_type="text/html",
+        headers={"ETag": etag, "Cache-Control": "public, max-age=3600"},
+    )
 
 # To run this application (for development):
 # uvicorn main:app --reload
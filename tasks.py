@@ -0,0 +1,45 @@
+"""
+Optional Celery integration for offloading audio audits to worker processes.
+
+A transcription+analysis run is seconds to minutes of CPU/GPU work, so doing
+it inline wedges the ASGI worker for the duration. When Celery is installed
+and CELERY_BROKER_URL is set, the API dispatches audits to a worker pool and
+clients poll /results/{task_id}/ instead. Without either, `audit_task` stays
+None and the API keeps its synchronous in-request behavior, so the web app
+remains fully functional with no extra infrastructure.
+
+Run a worker with:
+    celery -A tasks worker --loglevel=info
+"""
+import os
+
+from audit_processing import perform_full_audio_audit
+
+celery_app = None
+audit_task = None
+
+CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL")
+
+if CELERY_BROKER_URL:
+    try:
+        from celery import Celery
+
+        celery_app = Celery(
+            "audit",
+            broker=CELERY_BROKER_URL,
+            backend=os.environ.get("CELERY_RESULT_BACKEND", CELERY_BROKER_URL),
+        )
+
+        @celery_app.task(name="audit.perform_full_audio_audit")
+        def audit_task(audio_file_path: str) -> dict:
+            try:
+                return perform_full_audio_audit(audio_file_path)
+            finally:
+                # The web process hands ownership of the temp file to the worker.
+                try:
+                    os.remove(audio_file_path)
+                except OSError:
+                    pass
+    except ImportError:
+        print("Warning: CELERY_BROKER_URL is set but celery is not installed; "
+              "audits will run synchronously in the web process.")
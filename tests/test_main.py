@@ -39,7 +39,9 @@ def create_dummy_file(tmp_path_factory):
 
 # --- Tests for /upload/audio/ ---
 
-@patch('main.perform_full_audio_audit')
+# Small uploads (below IN_MEMORY_UPLOAD_LIMIT) are fed to the auditor straight
+# from the upload buffer, so these tests mock the stream-based entrypoint.
+@patch('main.perform_full_audio_audit_stream')
 def test_upload_audio_success(mock_perform_audit, client, create_dummy_file):
     mock_perform_audit.return_value = {
         "audio_file": "sample_valid.mp3",
@@ -65,7 +67,7 @@ def test_upload_audio_success(mock_perform_audit, client, create_dummy_file):
     assert not os.path.exists(os.path.join(TEMP_UPLOADS_DIR, "sample_valid.mp3"))
 
 
-@patch('main.perform_full_audio_audit')
+@patch('main.perform_full_audio_audit_stream')
 def test_upload_audio_processing_error_response(mock_perform_audit, client, create_dummy_file):
     mock_perform_audit.return_value = {
         "audio_file": "error_sample.mp3",
@@ -83,7 +85,7 @@ def test_upload_audio_processing_error_response(mock_perform_audit, client, crea
     assert data["status"] == "FAILED"
     mock_perform_audit.assert_called_once()
 
-@patch('main.perform_full_audio_audit')
+@patch('main.perform_full_audio_audit_stream')
 def test_upload_audio_processing_exception(mock_perform_audit, client, create_dummy_file):
     mock_perform_audit.side_effect = ValueError("Something went very wrong during processing")
     dummy_file_path = create_dummy_file("exception_sample.mp3")
@@ -95,6 +97,17 @@ def test_upload_audio_processing_exception(mock_perform_audit, client, create_du
     assert "Invalid data or processing error: Something went very wrong during processing" in data["detail"]
     mock_perform_audit.assert_called_once()
 
+def test_upload_audio_nul_in_filename(client):
+    # A NUL byte in the multipart filename must be rejected with a 400, not
+    # crash path resolution. httpx percent-encodes NUL in its multipart
+    # encoder, so send a raw body to get the literal byte to the server.
+    body = (b'--b0\r\nContent-Disposition: form-data; name="file"; filename="bad\x00name.mp3"\r\n'
+            b'Content-Type: audio/mpeg\r\n\r\ndata\r\n--b0--\r\n')
+    response = client.post("/upload/audio/", content=body,
+                           headers={"Content-Type": "multipart/form-data; boundary=b0"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid filename characters."
+
 def test_upload_audio_no_file(client):
     response = client.post("/upload/audio/", files={"file": ("empty.mp3", b"", "audio/mpeg")})
     # This will likely be caught by perform_full_audio_audit if it tries to process an empty file.
@@ -106,7 +119,7 @@ def test_upload_audio_no_file(client):
     # For now, let's expect a 500 or similar if the real function is hit without mocks and fails due to missing deps.
     # However, the goal is to test main.py's handling.
     # Let's assume 0-byte file makes `perform_full_audio_audit` (mocked) return an error
-    with patch('main.perform_full_audio_audit') as mock_audit_empty:
+    with patch('main.perform_full_audio_audit_stream') as mock_audit_empty:
         mock_audit_empty.return_value = {"audio_file": "empty.mp3", "error": "Cannot process empty file", "status": "FAILED"}
         response = client.post("/upload/audio/", files={"file": ("empty.mp3", BytesIO(b""), "audio/mpeg")}) # Use BytesIO for empty file
     
@@ -117,7 +130,9 @@ def test_upload_audio_no_file(client):
 
 # --- Tests for /upload/zip/ ---
 
-@patch('main.perform_full_audio_audit')
+# Small ZIP entries (below IN_MEMORY_ZIP_ENTRY_LIMIT) are audited in memory,
+# so the zip tests mock the bytes-based entrypoint.
+@patch('main.perform_full_audio_audit_bytes')
 def test_upload_zip_success_multiple_files(mock_perform_audit, client, tmp_path):
     # Create a dummy zip file
     zip_buffer = BytesIO()
@@ -145,7 +160,7 @@ def test_upload_zip_success_multiple_files(mock_perform_audit, client, tmp_path)
     # Check that the temporary zip and extraction folder are cleaned up (harder to check specific names due to UUID)
     # We rely on the client fixture's overall cleanup of TEMP_UPLOADS_DIR for now.
 
-@patch('main.perform_full_audio_audit')
+@patch('main.perform_full_audio_audit_bytes')
 def test_upload_zip_mixed_results(mock_perform_audit, client, tmp_path):
     zip_buffer = BytesIO()
     with zipfile.ZipFile(zip_buffer, "w") as zf:
@@ -169,13 +184,33 @@ def test_upload_zip_mixed_results(mock_perform_audit, client, tmp_path):
     assert mock_perform_audit.call_count == 2
 
 def test_upload_zip_invalid_zip_format(client):
-    # Upload a text file as a zip
+    # Upload a text file as a zip; magic-byte validation rejects it before
+    # the payload is written to disk.
     response = client.post("/upload/zip/", files={"file": ("notazip.zip", BytesIO(b"this is not a zip file"), "application/zip")})
-    assert response.status_code == 200 # main.py returns 200 with error in body for BadZipFile
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid file type. Only .zip files are accepted."
+
+def test_upload_zip_corrupted_zip(client):
+    # A payload with a valid ZIP signature but corrupted contents passes the
+    # magic-byte check and is caught by BadZipFile handling (200 + error body).
+    response = client.post("/upload/zip/", files={"file": ("corrupt.zip", BytesIO(b"PK\x03\x04" + b"garbage" * 10), "application/zip")})
+    assert response.status_code == 200
     data = response.json()
     assert "Error processing ZIP file." in data["message"]
     assert any("not a valid ZIP file or is corrupted" in err for err in data["errors"])
 
+def test_upload_zip_rejects_high_compression_ratio(client):
+    # A tiny DEFLATE entry expanding to many MB trips the zip-bomb ratio guard
+    # before any decompression happens.
+    zip_buffer = BytesIO()
+    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("bomb.mp3", b"\x00" * (10 * 1024 * 1024))
+    zip_buffer.seek(0)
+
+    response = client.post("/upload/zip/", files={"file": ("bomb.zip", zip_buffer, "application/zip")})
+    assert response.status_code == 413
+    assert "suspicious compression ratio" in response.json()["detail"]
+
 def test_upload_zip_empty_zip_file(client):
     zip_buffer = BytesIO()
     with zipfile.ZipFile(zip_buffer, "w") as zf:
@@ -188,7 +223,7 @@ def test_upload_zip_empty_zip_file(client):
     assert "No supported audio files found in the ZIP archive." in data["errors"]
     assert len(data["processed_files"]) == 0
 
-@patch('main.perform_full_audio_audit') # Mock to prevent actual calls
+@patch('main.perform_full_audio_audit_bytes') # Mock to prevent actual calls
 def test_upload_zip_no_audio_files(mock_perform_audit, client):
     zip_buffer = BytesIO()
     with zipfile.ZipFile(zip_buffer, "w") as zf: